@@ -1,17 +1,43 @@
-import attridict
+import asyncio
 import copy
+import itertools
 import json
 import os
+import random
+import re
 import slugify
-import time
 import threading
-from websocket import (
-    create_connection,
-    WebSocketConnectionClosedException,
-    WebSocketTimeoutException,
-)
+import websockets
+from collections import defaultdict
+from collections.abc import Mapping
+from contextlib import contextmanager
+from websockets.exceptions import ConnectionClosed
+
+from types import MethodType
+
+from service_utils import make_service_fn
+
+# Use orjson for message encode/decode when available -- it's several times
+# faster than stdlib json on the large get_states/registry payloads. HA's
+# WebSocket API requires text frames, so encoded bytes are decoded back to
+# str before sending.
+try:
+    import orjson
+
+    def _json_loads(raw):
+        return orjson.loads(raw)
+
+    def _json_dumps(payload):
+        return orjson.dumps(payload).decode()
+
+except ImportError:
+
+    def _json_loads(raw):
+        return json.loads(raw)
+
+    def _json_dumps(payload):
+        return json.dumps(payload)
 
-from service_utils import generate_function_code
 
 HASS_TOKEN = os.environ["HASS_TOKEN"]
 HASS_URL = f"wss://{os.environ['HASS_HOST']}/api/websocket"
@@ -27,13 +53,29 @@ REGISTRIES = {
     # etc., as needed
 }
 
+# Precomputed event-routing tables, so the per-event hot path is set/dict
+# lookups rather than endswith/replace string allocations
+_REGISTRY_UPDATE_EVENTS = {f"{registry_name}_updated": registry_name for registry_name in REGISTRIES}
+_IGNORED_EVENTS = {
+    "recorder_5min_statistics_generated",
+    "recorder_hourly_statistics_generated",
+}
+
+# Raw-text markers used to route messages without a full JSON parse. These
+# rely on HA's compact (no-space) serialization; when a marker doesn't
+# match, the message simply takes the normal full-parse path.
+_PONG_MARKER = '"type":"pong"'
+_RECORDER_MARKER = '"event_type":"recorder_'
+_ID_RE = re.compile(r'"id":\s?(\d+)')
+
 
 class HassClient:
     """
     The HassClient manages a WebSocket connection to Home Assistant, including
-    automatic reconnection and message handling. A ping thread monitors
-    connectivity and triggers reconnections as necessary, while a receiver
-    thread continually reads incoming messages.
+    automatic reconnection and message handling. Everything runs as coroutines
+    on a single asyncio event loop (hosted in a background thread), with the
+    websockets library handling ping/pong keepalives. Blocking callers such as
+    Entity and Device go through a thin sync facade on send_message.
     """
 
     def __init__(self, url, token, verbose=False):
@@ -44,21 +86,25 @@ class HassClient:
         # Underlying WebSocket connection
         self._ws = None
 
-        # Event used to stop threads
-        self._stop_event = threading.Event()
+        # Event loop (runs in a background thread) and the main runner task
+        self._loop = None
+        self._loop_thread = None
+        self._runner_task = None
 
-        # Message ID tracking and callbacks
-        self._current_id = 1
-        self._callbacks = {}
+        # Message ID generation and pending response futures. next() on a
+        # count is atomic in CPython, so ID assignment needs no locking even
+        # off the event loop thread.
+        self._id_gen = itertools.count(1)
+        self._pending = {}
 
-        # Keepalive and ping/pong tracking
-        self._last_ping_id = None
-        self._ping_interval = 10
-        self._last_ping_time = 0
+        # When corked, outgoing messages are buffered here and flushed
+        # together instead of being sent one at a time
+        self._send_buffer = None
 
-        # Thread references
-        self._receiver_thread = None
-        self._ping_thread = None
+        # Debounce handles for registry refreshes triggered by events, so a
+        # burst of registry_updated events coalesces into a single refetch
+        self._pending_refresh = {}
+        self._refresh_debounce = 0.2
 
         # Track whether authentication has completed so we don't send other messages too soon
         self._authenticated = False
@@ -66,167 +112,149 @@ class HassClient:
         # Used to prevent automatic reconnect attempts when user explicitly stops
         self._manual_stop = False
 
+        # Reconnect backoff: doubles (with jitter) on each failed attempt,
+        # capped at a minute, and resets once a connection succeeds
+        self._backoff = 1.0
+
         # Local store holds information about HA registries and states
         self.store = {registry_name: {} for registry_name in REGISTRIES}
         self.store["states"] = {}
 
+        # Cache of Entity instances, keyed by entity_id, so repeated lookups
+        # don't rebuild objects; invalidated on entity_registry updates
+        self._entity_cache = {}
+
+        # Secondary indexes over the entity registry, rebuilt on each
+        # registry refresh so lookups don't rescan the full registry
+        self._by_domain = {}
+        self._by_device = {}
+        self._enabled_ids = frozenset()
+
     def connect(self):
         """
-        Initializes the client by stopping any existing run,
-        creating receiver and ping threads, and attempting an initial connection.
+        Initializes the client by starting the event loop thread (if needed)
+        and scheduling the connection runner, which connects, receives, and
+        reconnects as necessary.
         """
         if self._ws:
             print("Already connected.")
             return
 
-        # Clean up old threads if they were running
-        self.stop()
-
         self._manual_stop = False
-        self._stop_event.clear()
 
-        # Attempt to establish the initial connection.
-        try:
-            self._establish_ws()
-            # self._post_auth_init()
-        except Exception as e:
-            print(f"Initial connect failed: {e}")
-            self._close_ws()
-            self._ws = None
-
-        # Ensure the receiver thread is running
-        if not self._receiver_thread or not self._receiver_thread.is_alive():
-            self._receiver_thread = threading.Thread(
-                target=self._receiver_loop, name="receiver", daemon=True
+        # Ensure the event loop thread is running
+        if not self._loop:
+            self._loop = asyncio.new_event_loop()
+            self._loop_thread = threading.Thread(
+                target=self._loop.run_forever, name="hass-loop", daemon=True
             )
-            self._receiver_thread.start()
+            self._loop_thread.start()
 
-        # Ensure the ping thread is running
-        if not self._ping_thread or not self._ping_thread.is_alive():
-            self._ping_thread = threading.Thread(
-                target=self._ping_loop, name="pinger", daemon=True
-            )
-            self._ping_thread.start()
+        # Kick off the runner coroutine on the loop
+        def _start():
+            if not self._runner_task or self._runner_task.done():
+                self._runner_task = self._loop.create_task(self._run())
 
-    def _establish_ws(self):
+        self._loop.call_soon_threadsafe(_start)
+
+    async def _establish_ws(self):
         """
         Opens a new WebSocket connection to the configured Home Assistant URL.
-        Raises an exception if unable to connect.
+        Raises an exception if unable to connect. The library's built-in
+        ping/pong keepalive detects dead connections for us. permessage-
+        deflate (RFC 7692) is negotiated explicitly: HA supports it, and the
+        multi-megabyte get_states/registry JSON fetched on every (re)connect
+        compresses to a fraction of its raw size; max_size is raised
+        accordingly since it applies to the decompressed payload.
         """
         print(f"Connecting to {self.url}...")
         self._authenticated = False
-        self._ws = create_connection(self.url, timeout=10)
+        # Unlike websocket-client, there's no skip_utf8_validation knob to
+        # pass here: websockets validates incoming text frames in its C
+        # speedups extension, which is already cheap relative to parsing.
+        self._ws = await websockets.connect(
+            self.url,
+            ping_interval=10,
+            ping_timeout=10,
+            max_size=2**24,
+            compression="deflate",
+        )
 
-    def _close_ws(self):
+    async def _close_ws(self):
         """
         Safely closes the WebSocket if it exists, then sets the reference to None.
         """
         if self._ws:
             try:
-                self._ws.close()
-            except:
+                await self._ws.close()
+            except Exception:
                 pass
         self._ws = None
         self._authenticated = False
 
-    def _receiver_loop(self):
+    async def _run(self):
         """
-        Continually reads messages from the WebSocket, if available.
-        If the connection is not open or a read error occurs, it
-        waits briefly and tries again. The ping thread handles all
-        reconnection logic.
+        Main connection loop: establishes the WebSocket, reads messages until
+        the connection drops, then reconnects. The library's keepalive pings
+        close the connection when the server stops responding, which lands us
+        back here to reconnect.
         """
-        while not self._stop_event.is_set():
-            if not self._ws:
-                # If there's no socket, wait briefly and loop again
-                time.sleep(1)
+        while not self._manual_stop:
+            try:
+                await self._establish_ws()
+                self._backoff = 1.0
+            except Exception as e:
+                print(f"Connection failed: {e}, retrying in ~{self._backoff:.0f}s...")
+                await asyncio.sleep(
+                    self._backoff + random.random() * self._backoff * 0.5
+                )
+                self._backoff = min(self._backoff * 2, 60.0)
                 continue
 
             try:
-                msg = self._ws.recv()
-                if not msg:
-                    continue
-            except WebSocketTimeoutException:
-                # A timeout is not critical; just continue receiving
-                continue
-            except WebSocketConnectionClosedException:
+                async for raw in self._ws:
+                    self._handle_message(raw)
+            except ConnectionClosed:
                 print("Receiver: WebSocket connection closed.")
-                self._ws = None
-                continue
             except Exception as e:
                 print(f"Receiver loop error: {e}")
-                self._ws = None
-                continue
-
-            self._handle_message(msg)
-
-        print("Receiver thread exiting...")
-
-    def _ping_loop(self):
-        """
-        Periodically checks connectivity and sends ping messages.
-        If a ping goes unacknowledged or if the WebSocket is unavailable,
-        this loop immediately attempts reconnection (with optional backoff).
-        """
-        while not self._stop_event.is_set():
-            if not self._ws:
-                # If no connection, try reconnecting immediately
-                print("[Ping] _ws is None, reconnecting proactively...")
-                self._attempt_reconnect()
-            else:
-                # Check if it's time to ping
-                now = time.time()
-                if (
-                    now - self._last_ping_time >= self._ping_interval
-                    and self._authenticated
-                ):
-                    self._last_ping_time = now
-
-                    # If we had a ping waiting for a pong, reconnect
-                    if self._last_ping_id is not None:
-                        print("[Ping] Previous ping unanswered, forcing reconnect...")
-                        self._attempt_reconnect()
-                    else:
-                        # Send a new ping
-                        self._last_ping_id = self.send_message({"type": "ping"})
-
-            time.sleep(1)
-
-        print("Ping thread exiting...")
-
-    def _attempt_reconnect(self):
-        """
-        Closes any existing WebSocket, then tries to re-establish it.
-        If it fails, _ws remains None so the ping thread can try again later.
-        """
-        self._close_ws()
-
-        if self._manual_stop:
-            return
+            finally:
+                await self._close_ws()
+                # The dead connection can never deliver the outstanding
+                # responses, so fail their futures rather than leaving
+                # awaiters (e.g. a mid-startup _post_auth_init gather, or
+                # external send_message callers) hanging across reconnects
+                self._cancel_pending()
 
-        # Attempt to reconnect after a brief delay for good measure
-        time.sleep(1)
-        try:
-            self._establish_ws()
-            # self._post_auth_init()
-            print("[Ping] Reconnected successfully.")
-        except Exception as e:
-            print(f"[Ping] Reconnection failed: {e}")
-            # Close again to ensure no partial connection remains
-            self._close_ws()
-            self._ws = None
-            return
+            if not self._manual_stop:
+                await asyncio.sleep(1)
 
-        # If successful, reset the ping ID
-        self._last_ping_id = None
+        print("Runner task exiting...")
 
     def _handle_message(self, raw_msg):
         """
         Processes a raw JSON message from Home Assistant.
         Routes to the appropriate handler based on the message type.
-        """
+        Runs on the event loop thread.
+        """
+        # Cheap pre-parse routing: pongs and the ignored recorder statistics
+        # events carry nothing we need beyond (at most) the message ID, so
+        # peek at the raw text and skip the full JSON parse for them.
+        if isinstance(raw_msg, str):
+            prefix = raw_msg[:128]
+            if _PONG_MARKER in prefix:
+                m = _ID_RE.search(prefix)
+                if m:
+                    msg_id = int(m.group(1))
+                    self._resolve_pending(
+                        msg_id, {"id": msg_id, "type": "pong", "success": True}
+                    )
+                return
+            if _RECORDER_MARKER in prefix:
+                return
+
         try:
-            data = json.loads(raw_msg)
+            data = _json_loads(raw_msg)
         except ValueError:
             print(f"Non-JSON message: {raw_msg}")
             return
@@ -240,42 +268,47 @@ class HassClient:
             return
         elif msg_type == "auth_ok":
             print("Authenticated successfully.")
-            self._post_auth_init()
+            self._loop.create_task(self._post_auth_init())
             return
         elif msg_type == "auth_invalid":
             print(f"Authentication invalid: {data}")
-            self.stop()
-            return
-
-        if msg_type == "pong":
-            # Acknowledge the pong for our last ping
-            if msg_id in self._callbacks:
-                cb = self._callbacks.pop(msg_id, None)
-                if cb:
-                    cb(data)
-            self._last_ping_id = None
+            self._loop.create_task(self._close_ws())
+            self._manual_stop = True
             return
 
         if msg_type == "result":
-            # Possibly handle success/failure for a request
-            success = data.get("success", False)
-            if success and msg_id in self._callbacks:
-                cb = self._callbacks.pop(msg_id)
-                cb(data)
+            self._resolve_pending(msg_id, data)
             return
 
         if msg_type == "event":
             self._handle_event(data)
             return
 
-        # If there's a callback for this ID, call it
-        if msg_id in self._callbacks:
-            cb = self._callbacks.pop(msg_id, None)
-            if cb:
-                cb(data)
+        # If there's a pending future for this ID, resolve it
+        if msg_id in self._pending:
+            self._resolve_pending(msg_id, data)
         else:
             print(f"Unhandled message: {data}")
 
+    def _cancel_pending(self):
+        """
+        Cancels all futures still awaiting a response, so their awaiters fail
+        fast instead of waiting on a connection that no longer exists.
+        Response callbacks are skipped for cancelled futures.
+        """
+        pending, self._pending = self._pending, {}
+        for fut in pending.values():
+            if not fut.done():
+                fut.cancel()
+
+    def _resolve_pending(self, msg_id, data):
+        """
+        Resolves the pending future for a message ID, if one exists.
+        """
+        fut = self._pending.pop(msg_id, None)
+        if fut is not None and not fut.done():
+            fut.set_result(data)
+
     def _send_auth(self):
         """
         Sends Home Assistant authentication message using the stored token.
@@ -285,56 +318,87 @@ class HassClient:
             if self.verbose:
                 print("Sending auth message with token...")
             msg = {"type": "auth", "access_token": self.token}
-            self._ws.send(json.dumps(msg))
+            self._loop.create_task(self._transmit(_json_dumps(msg)))
 
-    def _post_auth_init(self):
+    async def _post_auth_init(self):
         """
         Subscribes to events and fetches initial data after a successful authentication.
         This method is called both after the first connection and any reconnection.
+        All requests go out corked as one write burst and are awaited together,
+        so startup latency is bounded by the slowest response instead of the
+        sum of the round trips.
         """
 
         self._authenticated = True
 
-        # Subscribe to all events
-        self.send_message({"type": "subscribe_events"})
+        with self.cork():
+            # Subscribe to all events
+            futs = [self.send_message({"type": "subscribe_events"})]
 
-        # Fetch data from each known registry
-        for registry_name in REGISTRIES:
-            self.refresh_registry(registry_name)
+            # Fetch data from each known registry
+            for registry_name in REGISTRIES:
+                futs.append(self.refresh_registry(registry_name))
+
+            # Fetch the initial set of entity states
+            futs.append(self._get_states())
 
-        # Fetch the initial set of entity states
-        self._get_states()
+            # Get the list of services
+            futs.append(self.send_message({"type": "get_services"}, callback=self._handle_get_services))
 
-        # Get the list of services
-        self.send_message({"type": "get_services"}, callback=lambda msg: self.store.update({"services": msg.get("result", {})}))
+        await asyncio.gather(*futs, return_exceptions=True)
 
     def _handle_event(self, data):
         """
         Handles event messages from Home Assistant. This may include
-        registry updates and state_changed events.
+        registry updates and state_changed events. Checks are ordered by
+        expected frequency: state_changed dominates in a busy install,
+        followed by the ignored recorder events, with the rare registry
+        updates last.
         """
         event_obj = data.get("event", {})
         event_type = event_obj.get("event_type")
 
-        if event_type and event_type.endswith("_registry_updated"):
-            # For example: "entity_registry_updated" => "entity_registry"
-            registry_name = event_type.replace("_updated", "")
-            if registry_name in REGISTRIES:
-                print(f"{registry_name} changed -> refreshing full list.")
-                self.refresh_registry(registry_name)
-                if registry_name == "entity_registry":
-                    # Also refresh states if the entity registry was updated
-                    self._get_states()
-        elif event_type == "state_changed":
+        if event_type == "state_changed":
             self._handle_state_changed_event(event_obj)
-        elif event_type in (
-            "recorder_5min_statistics_generated",
-            "recorder_hourly_statistics_generated",
-        ):
-            # Ignore these events
             return
-        else:
-            print(f"Unhandled event: {data}")
+
+        if event_type in _IGNORED_EVENTS:
+            return
+
+        # For example: "entity_registry_updated" => "entity_registry"
+        registry_name = _REGISTRY_UPDATE_EVENTS.get(event_type)
+        if registry_name is not None:
+            print(f"{registry_name} changed -> scheduling refresh.")
+            if registry_name == "entity_registry":
+                # Cached Entity objects may now point at renamed or
+                # removed entities, so drop them right away
+                self._entity_cache.clear()
+            self._schedule_refresh(registry_name)
+            return
+
+        print(f"Unhandled event: {data}")
+
+    def _schedule_refresh(self, registry_name):
+        """
+        Debounced wrapper around refresh_registry for registry-update events.
+        At most one refresh per registry is scheduled per debounce window, so
+        a bulk import or integration reload that fires dozens of events costs
+        a single list round trip (plus one get_states for the entity
+        registry) instead of one per event.
+        """
+        if registry_name in self._pending_refresh:
+            return
+
+        def fire():
+            self._pending_refresh.pop(registry_name, None)
+            self.refresh_registry(registry_name)
+            if registry_name == "entity_registry":
+                # Also refresh states if the entity registry was updated
+                self._get_states()
+
+        self._pending_refresh[registry_name] = self._loop.call_later(
+            self._refresh_debounce, fire
+        )
 
     def _handle_state_changed_event(self, event_obj):
         """
@@ -349,24 +413,55 @@ class HassClient:
         if new_state is not None:
             self.store["states"][entity_id] = new_state
 
+    def _handle_get_services(self, msg):
+        """
+        Stores the service definitions and invalidates any service wrappers
+        compiled against the previous definitions. Error responses are
+        ignored so a failed fetch doesn't wipe the definitions we have.
+        """
+        if not msg.get("result"):
+            return
+        self.store["services"] = msg["result"]
+        Services._fn_cache.clear()
+
     def _get_states(self):
         """
         Requests a full list of states from Home Assistant and stores them locally.
         """
-        self.send_message({"type": "get_states"}, callback=self._handle_get_states)
+        return self.send_message({"type": "get_states"}, callback=self._handle_get_states)
 
     def _handle_get_states(self, msg):
         """
         Called once after requesting get_states. The result should be a list
-        of state objects, each typically having an 'entity_id' key.
+        of state objects, each typically having an 'entity_id' key. Error
+        responses are ignored so a failed fetch doesn't clear known states.
         """
-        result = msg.get("result", [])
+        result = msg.get("result")
+        if not result:
+            return
         new_states = {}
         for st in result:
             entity_id = st.get("entity_id")
             if entity_id:
                 new_states[entity_id] = st
-        self.store["states"] = new_states
+        # Mutate the existing dict instead of swapping in a new one, so any
+        # code holding a reference to store["states"] keeps seeing updates
+        # and state_changed writes never land in an about-to-be-discarded
+        # dict. All store writes happen on the loop thread, so no lock is
+        # needed around the clear/update pair.
+        states = self.store["states"]
+        states.clear()
+        states.update(new_states)
+
+    def get_state_attr(self, entity_id, key, default=None):
+        """
+        Fast-path read of a single attribute from an entity's state: one
+        dict-chain lookup, no wrapper objects or copies.
+        """
+        state = self.store["states"].get(entity_id)
+        if state is None:
+            return default
+        return state.get("attributes", {}).get(key, default)
 
     def refresh_registry(self, registry_name):
         """
@@ -379,17 +474,48 @@ class HassClient:
                 return
             items = msg["result"]
             id_field = REGISTRIES[registry_name]
-            new_data = {}
-            for item in items:
-                rec_id = item.get(id_field)
-                if rec_id:
-                    new_data[rec_id] = item
-            self.store[registry_name] = new_data
-
-        self.send_message(
+            if registry_name == "entity_registry":
+                self._ingest_entity_registry(items, id_field)
+            else:
+                self.store[registry_name] = {
+                    rec_id: item
+                    for item in items
+                    if (rec_id := item.get(id_field))
+                }
+
+        return self.send_message(
             {"type": f"config/{registry_name}/list"}, callback=on_list_result
         )
 
+    def _ingest_entity_registry(self, items, id_field):
+        """
+        Ingests an entity_registry list result in a single pass, building the
+        registry dict together with the secondary indexes (by domain, by
+        device, and the set of enabled entity IDs) that keep Domains,
+        Entities, and Device lookups from rescanning the registry. The new
+        structures are published with one tuple assignment so readers never
+        see the registry and its indexes out of step.
+        """
+        new_data = {}
+        by_domain = defaultdict(list)
+        by_device = defaultdict(list)
+        enabled = set()
+        for item in items:
+            eid = item.get(id_field)
+            if not eid:
+                continue
+            new_data[eid] = item
+            by_domain[eid.split(".", 1)[0]].append(eid)
+            by_device[item.get("device_id")].append(eid)
+            if item.get("disabled_by") is None:
+                enabled.add(eid)
+        (
+            self.store["entity_registry"],
+            self._by_domain,
+            self._by_device,
+            self._enabled_ids,
+        ) = (new_data, by_domain, by_device, frozenset(enabled))
+
     def update_registry(self, registry, callback=None, **kwargs):
         """
         Sends an update request for the specified registry. When the update
@@ -407,8 +533,29 @@ class HassClient:
 
     def send_message(self, payload, callback=None):
         """
-        Sends a JSON message to the server. Each message is assigned a unique ID.
+        Sends a JSON message to the server. Each message is assigned a unique
+        ID, and a Future is returned that resolves with the matching response.
         An optional callback is triggered once a response is received.
+
+        Safe to call both from the event loop thread (the send is scheduled
+        and the Future returned immediately) and from other threads (via
+        run_coroutine_threadsafe).
+        """
+        if threading.current_thread() is self._loop_thread:
+            return self._send(payload, callback)
+
+        if not self._loop:
+            raise RuntimeError("Not connected, can't send message.")
+
+        return asyncio.run_coroutine_threadsafe(
+            self._async_send(payload, callback), self._loop
+        ).result()
+
+    def _send(self, payload, callback=None):
+        """
+        Core send path; must run on the event loop thread. Registers a Future
+        for the response, schedules the actual WebSocket send, and returns
+        the Future.
         """
         if not self._ws:
             raise RuntimeError("Not connected, can't send message.")
@@ -416,41 +563,108 @@ class HassClient:
         if not self._authenticated:
             raise RuntimeError("Not authenticated, can't send message.")
 
-        msg_id = self._current_id
-        self._current_id += 1
+        msg_id = next(self._id_gen)
         payload["id"] = msg_id
 
+        fut = self._loop.create_future()
+        self._pending[msg_id] = fut
         if callback:
-            self._callbacks[msg_id] = callback
+            fut.add_done_callback(
+                lambda f: callback(f.result()) if not f.cancelled() else None
+            )
 
         if self.verbose:
             print(f"Sending message: {payload}")
 
-        self._ws.send(json.dumps(payload))
-        return msg_id
+        data = _json_dumps(payload)
+        if self._send_buffer is not None:
+            self._send_buffer.append(data)
+        else:
+            self._loop.create_task(self._transmit(data))
+        return fut
+
+    async def _async_send(self, payload, callback=None):
+        return self._send(payload, callback)
+
+    async def _transmit(self, data):
+        """
+        Writes a single already-serialized message to the WebSocket.
+        """
+        try:
+            await self._ws.send(data)
+        except Exception as e:
+            print(f"Send failed: {e}")
+
+    @contextmanager
+    def cork(self):
+        """
+        Buffers all messages sent inside the block and flushes them as one
+        back-to-back write burst on exit, instead of one scheduled send per
+        message. Useful for burst sequences like _post_auth_init, where N
+        separate sends would each pay their own wakeup and syscall. Responses
+        still arrive individually; only the outgoing side is batched.
+        """
+        self._send_buffer = []
+        try:
+            yield
+        finally:
+            buf, self._send_buffer = self._send_buffer, None
+            if buf:
+                self._loop.create_task(self._flush(buf))
+
+    async def _flush(self, frames):
+        """
+        Sends a batch of already-serialized messages back-to-back in a single
+        task, so the writes coalesce into as few TCP segments as possible.
+        """
+        try:
+            for data in frames:
+                await self._ws.send(data)
+        except Exception as e:
+            print(f"Flush failed: {e}")
 
     def stop(self):
         """
-        Signals all running threads to stop and closes the WebSocket.
-        Used to gracefully shut down the client.
+        Cancels the runner task, closes the WebSocket, and stops the event
+        loop. Used to gracefully shut down the client. When called from the
+        event loop thread (e.g. from a response callback), the shutdown is
+        scheduled rather than waited on, since blocking the loop on its own
+        work would deadlock; from any other thread it blocks until complete.
         """
         self._manual_stop = True
-        self._stop_event.set()
         self._authenticated = False
-        self._close_ws()
 
-        # Join receiver thread
-        if (
-            self._receiver_thread
-            and self._receiver_thread != threading.current_thread()
-        ):
-            self._receiver_thread.join()
-            self._receiver_thread = None
+        if not self._loop or not self._loop.is_running():
+            return
 
-        # Join ping thread
-        if self._ping_thread and self._ping_thread != threading.current_thread():
-            self._ping_thread.join()
-            self._ping_thread = None
+        loop, thread = self._loop, self._loop_thread
+        self._loop = None
+        self._loop_thread = None
+
+        if threading.current_thread() is thread:
+            task = loop.create_task(self._shutdown())
+            task.add_done_callback(lambda _: loop.stop())
+        else:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+
+    async def _shutdown(self):
+        """
+        Cancels outstanding tasks and closes the connection. Runs on the loop.
+        """
+        if self._runner_task and not self._runner_task.done():
+            self._runner_task.cancel()
+            try:
+                await self._runner_task
+            except asyncio.CancelledError:
+                pass
+            self._runner_task = None
+        self._cancel_pending()
+        for handle in self._pending_refresh.values():
+            handle.cancel()
+        self._pending_refresh.clear()
+        await self._close_ws()
 
     def __enter__(self):
         """
@@ -463,47 +677,78 @@ class HassClient:
         self.stop()
 
     def get_entity(self, entity_id):
-        return Entity(entity_id, self)
+        entity = self._entity_cache.get(entity_id)
+        if entity is None:
+            entity = self._entity_cache.setdefault(entity_id, Entity(entity_id, self))
+        return entity
 
     def get_device(self, device_id):
         return Device(device_id, self)
 
     def get_entities(self, include_disabled=False):
-        return [Entity(eid, self) for eid in self.store["entity_registry"] if (include_disabled or self.store["entity_registry"][eid].get("disabled_by") is None)]
+        ids = self.store["entity_registry"] if include_disabled else self._enabled_ids
+        return [self.get_entity(eid) for eid in ids]
 
     @property
     def entities(self):
         return Domains(self)
 
 
+class _ReadOnlyAttrDict(Mapping):
+    """
+    A read-only, attribute-accessible view over a dict in the client store.
+    Wraps the underlying dict by reference instead of deep-copying it, which
+    keeps registry/state property access cheap; nested dicts are wrapped
+    lazily on access. Callers that actually need to mutate should take a
+    mutable_copy().
+    """
+
+    __slots__ = ("_data",)
+
+    def __init__(self, data):
+        self._data = data
+
+    def __getitem__(self, key):
+        value = self._data[key]
+        if isinstance(value, dict):
+            return _ReadOnlyAttrDict(value)
+        return value
+
+    def __getattr__(self, key):
+        try:
+            return self[key]
+        except KeyError:
+            raise AttributeError(key)
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self._data!r})"
+
+    def mutable_copy(self):
+        return copy.deepcopy(self._data)
+
+
 class Domains(list):
 
+    __slots__ = ("client", "device_id")
+
     def __init__(self, client, device_id=None):
         self.client = client
         self.device_id = device_id
-        self.extend(
-            set(
-                [
-                    entity_id.split(".")[0]
-                    for entity_id in self.client.store["entity_registry"].keys()
-                    if (
-                        device_id is None
-                        or self.client.store["entity_registry"][entity_id].get(
-                            "device_id"
-                        )
-                        == device_id
-                    )
-                    and (
-                        (
-                            self.client.store["entity_registry"][entity_id].get(
-                                "disabled_by"
-                            )
-                            is None
-                        )
-                    )
-                ]
-            )
-        )
+        if device_id is None:
+            ids = self.client._enabled_ids
+        else:
+            ids = [
+                eid
+                for eid in self.client._by_device.get(device_id, ())
+                if eid in self.client._enabled_ids
+            ]
+        self.extend({eid.split(".", 1)[0] for eid in ids})
 
     def __getattr__(self, domain):
         return Entities(self.client, domain, device_id=self.device_id)
@@ -517,21 +762,20 @@ class Domains(list):
 
 class Entities(list):
 
+    __slots__ = ("client", "domain", "device_id")
+
     def __init__(self, client, domain, device_id=None):
         self.client = client
         self.domain = domain
         self.device_id = device_id
+        ids = self.client._by_domain.get(domain, ())
+        if device_id is not None:
+            on_device = set(self.client._by_device.get(device_id, ()))
+            ids = [eid for eid in ids if eid in on_device]
         self.extend(
-            [
-                Entity(eid, self.client)
-                for eid in self.client.store["entity_registry"].keys()
-                if eid.startswith(f"{domain}.")
-                and (
-                    device_id is None
-                    or self.client.store["entity_registry"][eid].get("device_id")
-                    == device_id
-                ) and (self.client.store["entity_registry"][eid].get("disabled_by") is None)
-            ]
+            self.client.get_entity(eid)
+            for eid in ids
+            if eid in self.client._enabled_ids
         )
 
     def __getattr__(self, object_id):
@@ -545,22 +789,24 @@ class Entities(list):
 
     def __getitem__(self, object_id):
         return self.__getattr__(object_id)
-    
+
     def __dir__(self):
         return [e._object_id for e in self]
 
 
 class Entity:
 
+    __slots__ = ("_entity_id", "_domain", "_object_id", "client")
+
     def __init__(self, entity_id, client):
         self._entity_id = entity_id
-        self._domain, self._object_id = entity_id.split(".")
+        self._domain, _, self._object_id = entity_id.partition(".")
         self.client = client
 
     @property
     def registry(self):
-        return attridict(
-            copy.deepcopy(self.client.store["entity_registry"].get(self.entity_id))
+        return _ReadOnlyAttrDict(
+            self.client.store["entity_registry"].get(self.entity_id) or {}
         )
 
     @property
@@ -568,10 +814,12 @@ class Entity:
         state = self.client.store["states"].get(self.entity_id)
         if state is None:
             return None
-        return attridict(copy.deepcopy(state))
+        return _ReadOnlyAttrDict(state)
 
     def get_name(self):
-        return self.state.get("attributes", {}).get("friendly_name", "")
+        # Called from __str__, get_names, and list comprehensions, so use
+        # the client's fast-path accessor rather than the state wrapper
+        return self.client.get_state_attr(self._entity_id, "friendly_name", "")
 
     def set_name(self, value):
         self.update_registry(name=value)
@@ -595,7 +843,7 @@ class Entity:
             new_entity_id = f"{self._domain}.{new_entity_id}"
         self.update_registry(new_entity_id=new_entity_id)
         self._entity_id = new_entity_id
-        self._object_id = self.entity_id.split(".")[1]
+        self._object_id = new_entity_id.partition(".")[2]
 
     entity_id = property(get_entity_id, set_entity_id)
 
@@ -616,7 +864,7 @@ class Entity:
         self.update_registry(disabled_by="user")
 
     enabled = property(
-        lambda self: self.registry.get("disabled_by") is None,
+        lambda self: self._entity_id in self.client._enabled_ids,
         lambda self, value: self.enable() if value else self.disable(),
     )
 
@@ -660,16 +908,26 @@ class Entity:
 
 class Services:
 
+    __slots__ = ("entity", "service_defs")
+
+    # Service functions keyed by (domain, service). Shared across instances
+    # and cleared whenever a fresh get_services result arrives.
+    _fn_cache = {}
+
     def __init__(self, entity):
         self.entity = entity
         self.service_defs = entity.client.store["services"].get(entity._domain)
 
     def __getattr__(self, service):
-        service_def = self.service_defs.get(service)
-        code = generate_function_code(self.entity._domain, service, service_def)
-        exec(code)
-        service_fn = locals()["wrapper_fn"](self.entity)
-        return service_fn
+        key = (self.entity._domain, service)
+        fn = Services._fn_cache.get(key)
+        if fn is None:
+            service_def = self.service_defs.get(service)
+            fn = make_service_fn(self.entity._domain, service, service_def)
+            Services._fn_cache[key] = fn
+        # Bind the entity as the first argument; MethodType preserves
+        # the generated docstring for help() and IDE hover
+        return MethodType(fn, self.entity)
 
     def __dir__(self):
         return [s for s in self.service_defs]
@@ -677,6 +935,8 @@ class Services:
 
 class Device:
 
+    __slots__ = ("_device_id", "client")
+
     def __init__(self, device_id, client):
         self._device_id = device_id
         self.client = client
@@ -687,8 +947,8 @@ class Device:
 
     @property
     def registry(self):
-        return attridict(
-            copy.deepcopy(self.client.store["device_registry"].get(self.device_id))
+        return _ReadOnlyAttrDict(
+            self.client.store["device_registry"].get(self.device_id) or {}
         )
 
     def get_name(self):
@@ -716,10 +976,9 @@ class Device:
 
     def get_entities(self, include_disabled=False):
         return [
-            Entity(eid, self.client)
-            for eid, e in self.client.store["entity_registry"].items()
-            if e.get("device_id") == self.device_id
-            and (include_disabled or e.get("disabled_by") is None)
+            self.client.get_entity(eid)
+            for eid in self.client._by_device.get(self.device_id, ())
+            if include_disabled or eid in self.client._enabled_ids
         ]
 
 
@@ -14,93 +14,89 @@ def flatten_fields(fields: dict) -> dict:
     return result
 
 
+def _fmt_number(num: dict) -> str:
+    min_ = num.get("min")
+    max_ = num.get("max")
+    unit = num.get("unit_of_measurement")
+    if min_ is not None and max_ is not None:
+        if unit:
+            return f"(Range: {min_} to {max_} {unit})"
+        else:
+            return f"(Range: {min_} to {max_})"
+    # If we have only a min or only a max, or none, just say numeric
+    return "(numeric value)"
+
+
+def _fmt_select(sel: dict) -> str:
+    options = sel.get("options", [])
+    # Possibly: options can be just a list of strings or a list of dicts
+    if options and isinstance(options[0], dict):
+        # e.g. [{"label": "Long", "value": "long"}, ...]
+        vals = [o.get("value") for o in options if "value" in o]
+        return f"(Allowed values: {vals})"
+    else:
+        # e.g. ["homeassistant", "aliceblue", ...]
+        return f"(Allowed values: {options})"
+
+
+def _fmt_color_temp(ct: dict) -> str:
+    # e.g. {"unit": "kelvin", "min": 2000, "max": 6500}
+    unit = ct.get("unit", "kelvin")
+    min_ = ct.get("min")
+    max_ = ct.get("max")
+    if min_ is not None and max_ is not None:
+        return f"(Range: {min_} to {max_} {unit})"
+    return f"(color_temp in {unit})"
+
+
+def _fmt_constant(const: dict) -> str:
+    val = const.get("value")
+    lab = const.get("label")
+    return f"(constant: {val}, label: {lab})"
+
+
+# Dispatch table mapping selector type to its formatter
+_SELECTOR_HANDLERS = {
+    "number": _fmt_number,
+    "select": _fmt_select,
+    "color_temp": _fmt_color_temp,
+    "color_rgb": lambda _: "(RGB color list, e.g. [255, 100, 100])",
+    "object": lambda _: "(arbitrary object/dict)",
+    "constant": _fmt_constant,
+    "text": lambda _: "(text/string)",
+    "time": lambda _: "(time string, e.g. HH:MM:SS)",
+    "date": lambda _: "(date string, e.g. YYYY-MM-DD)",
+    "datetime": lambda _: "(date+time string, e.g. 2023-11-17 13:30:00)",
+    "boolean": lambda _: "(boolean: true/false)",
+    "template": lambda _: "(template string or Jinja2 expression)",
+    # ... handle more as needed ...
+}
+
+
 def get_allowed_values(selector: dict) -> str:
     """
     Returns a short string summarizing allowed or possible values/ranges,
-    parsed from the field's 'selector' definition.
+    parsed from the field's 'selector' definition. HA selectors carry a
+    single top-level key, so this is one dict lookup plus one handler call.
     """
-    if "number" in selector:
-        num = selector["number"]
-        min_ = num.get("min")
-        max_ = num.get("max")
-        unit = num.get("unit_of_measurement")
-        if min_ is not None and max_ is not None:
-            if unit:
-                return f"(Range: {min_} to {max_} {unit})"
-            else:
-                return f"(Range: {min_} to {max_})"
-        # If we have only a min or only a max, or none, just say numeric
-        return "(numeric value)"
-    elif "select" in selector:
-        sel = selector["select"]
-        options = sel.get("options", [])
-        # Possibly: options can be just a list of strings or a list of dicts
-        if options and isinstance(options[0], dict):
-            # e.g. [{"label": "Long", "value": "long"}, ...]
-            vals = [o.get("value") for o in options if "value" in o]
-            return f"(Allowed values: {vals})"
-        else:
-            # e.g. ["homeassistant", "aliceblue", ...]
-            return f"(Allowed values: {options})"
-    elif "color_temp" in selector:
-        # e.g. {"unit": "kelvin", "min": 2000, "max": 6500}
-        ct = selector["color_temp"]
-        unit = ct.get("unit", "kelvin")
-        min_ = ct.get("min")
-        max_ = ct.get("max")
-        if min_ is not None and max_ is not None:
-            return f"(Range: {min_} to {max_} {unit})"
-        return f"(color_temp in {unit})"
-    elif "color_rgb" in selector:
-        return "(RGB color list, e.g. [255, 100, 100])"
-    elif "object" in selector:
-        return "(arbitrary object/dict)"
-    elif "constant" in selector:
-        val = selector["constant"].get("value")
-        lab = selector["constant"].get("label")
-        return f"(constant: {val}, label: {lab})"
-    elif "text" in selector:
-        # Possibly freeform text
-        return "(text/string)"
-    elif "time" in selector:
-        return "(time string, e.g. HH:MM:SS)"
-    elif "date" in selector:
-        return "(date string, e.g. YYYY-MM-DD)"
-    elif "datetime" in selector:
-        return "(date+time string, e.g. 2023-11-17 13:30:00)"
-    elif "boolean" in selector:
-        return "(boolean: true/false)"
-    elif "template" in selector:
-        return "(template string or Jinja2 expression)"
-    # ... handle more as needed ...
+    for key, val in selector.items():
+        handler = _SELECTOR_HANDLERS.get(key)
+        if handler:
+            return handler(val)
     return ""
 
 
-def generate_function_code(domain: str, service_name: str, service_def: dict) -> str:
+def build_doc_lines(service_def: dict) -> list:
     """
-    Creates a Python function definition for a given service definition.
-
-    Example signature:  def light__turn_on(...):
-        \"\"\"Description, then doc lines for each field...\"\"\"
+    Builds the documentation lines for a service: the top-level description
+    followed by one line per field summarizing its description, allowed
+    values, example, and whether it's required.
     """
-    func_lines = []
-    indent = " " * 4
-
     # Top-level description
     description = service_def.get("description", "")
     # Extract fields, flatten advanced if present
     fields = flatten_fields(service_def.get("fields", {}))
-    # Build param list, defaulting all to None (or maybe optional)
-    # We skip "target" because it's not an actual field, usually a separate concept
-    # param_names = list(fields.keys())
-    # params_str = ", ".join(f"{p}=None" for p in param_names)
-    params_str = ""
 
-    func_lines.append(f"def wrapper_fn(entity):")
-
-    func_lines.append(f"{indent}def {service_name}(**kwargs):")
-
-    # Build docstring lines
     docstring_lines = []
     if description:
         docstring_lines.append(description.strip())
@@ -128,11 +124,52 @@ def generate_function_code(domain: str, service_name: str, service_def: dict) ->
             line += "  (required)"
         docstring_lines.append(line)
 
+    return docstring_lines
+
+
+def make_service_fn(domain: str, service_name: str, service_def: dict):
+    """
+    Creates a callable for a service definition as a plain closure, with the
+    generated docstring attached via __doc__. The returned function takes the
+    entity as its first argument, so callers can bind it per-entity. No
+    source generation or exec involved.
+    """
+    docstring_lines = build_doc_lines(service_def)
+    docstring = "\n\n".join(docstring_lines) or "No description."
+
+    def service_fn(entity, **kwargs):
+        return entity.call_service(service_name, **kwargs)
+
+    service_fn.__name__ = service_name
+    service_fn.__qualname__ = f"{domain}.{service_name}"
+    service_fn.__doc__ = docstring
+    return service_fn
+
+
+def generate_function_code(domain: str, service_name: str, service_def: dict) -> str:
+    """
+    Creates a Python function definition for a given service definition.
+    Only used for dumping generated source (see main); the client binds
+    services via make_service_fn instead.
+
+    Example signature:  def light__turn_on(...):
+        \"\"\"Description, then doc lines for each field...\"\"\"
+    """
+    func_lines = []
+    indent = " " * 4
+
+    func_lines.append(f"def wrapper_fn(entity):")
+
+    func_lines.append(f"{indent}def {service_name}(**kwargs):")
+
+    docstring_lines = build_doc_lines(service_def)
+
     if not docstring_lines:
         docstring = '"""No description."""'
     else:
         # Indent the docstring content
-        docstring = '"""' + "\n\n{indent}{indent}".join(docstring_lines) + '\n"""'
+        sep = "\n\n" + indent * 2
+        docstring = '"""' + sep.join(docstring_lines) + "\n" + indent * 2 + '"""'
 
     func_lines.append(f"{indent}{indent}{docstring}")
 